@@ -0,0 +1,109 @@
+"""
+Offline evaluation of the local triage fast path.
+
+Runs the local classifier and the LLM over historical tickets and reports,
+for a range of confidence thresholds, how many LLM calls would be avoided
+and how often the local answer agrees with the LLM.
+
+Usage:
+    python evaluate_triage.py                     # last 200 tickets from Supabase
+    python evaluate_triage.py --limit 500
+    python evaluate_triage.py --file tickets.jsonl  # {"subject": ..., "description": ...} per line
+"""
+import argparse
+import asyncio
+import json
+import os
+from dotenv import load_dotenv
+from supabase import create_client
+from services.ai import classify_ticket
+from services.openrouter import get_openrouter_client
+from services.triage import get_confidence_threshold
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.9]
+
+
+def load_tickets(path, limit):
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()][:limit]
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+    if not url or not key:
+        print("Error: Supabase credentials not found in .env")
+        return []
+
+    supabase = create_client(url, key)
+    result = supabase.table("tickets").select("id, subject, description").order(
+        "created_at", desc=True
+    ).limit(limit).execute()
+    return result.data or []
+
+
+async def evaluate(tickets):
+    client = get_openrouter_client()
+    rows = []
+    for i, ticket in enumerate(tickets, 1):
+        subject = ticket.get("subject", "")
+        description = ticket.get("description", "")
+        local = classify_ticket(subject, description)
+        try:
+            llm = await client.analyze_ticket(subject, description)
+        except Exception as e:
+            print(f"[{i}/{len(tickets)}] LLM error, skipping: {e}")
+            continue
+        if llm.get("fallback"):
+            print(f"[{i}/{len(tickets)}] Unparseable LLM response, skipping")
+            continue
+        rows.append({
+            "confidence": local["confidence"],
+            "priority_match": local["priority"] == str(llm.get("priority", "")).lower(),
+            "category_match": local["category"] == str(llm.get("category", "")).lower()
+        })
+        print(f"[{i}/{len(tickets)}] confidence={local['confidence']:.2f} "
+              f"local={local['priority']}/{local['category']} "
+              f"llm={llm.get('priority')}/{llm.get('category')}")
+    return rows
+
+
+def report(rows):
+    total = len(rows)
+    if not total:
+        print("No tickets evaluated.")
+        return
+
+    current = get_confidence_threshold()
+    print(f"\nEvaluated {total} tickets (configured threshold: {current})\n")
+    print(f"{'threshold':>9}  {'avoided':>8}  {'priority':>8}  {'category':>8}  {'both':>6}")
+    for threshold in sorted(set(THRESHOLDS + [current])):
+        local = [r for r in rows if r["confidence"] >= threshold]
+        if local:
+            priority = sum(r["priority_match"] for r in local) / len(local)
+            category = sum(r["category_match"] for r in local) / len(local)
+            both = sum(r["priority_match"] and r["category_match"] for r in local) / len(local)
+        else:
+            priority = category = both = 0.0
+        print(f"{threshold:>9.2f}  {len(local) / total:>8.1%}  "
+              f"{priority:>8.1%}  {category:>8.1%}  {both:>6.1%}")
+    print("\navoided = fraction of LLM calls skipped; agreement is over those tickets only.")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Evaluate local triage against the LLM")
+    parser.add_argument("--file", help="JSONL file of tickets instead of Supabase")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    tickets = load_tickets(args.file, args.limit)
+    if not tickets:
+        print("No tickets to evaluate.")
+        return
+
+    rows = asyncio.run(evaluate(tickets))
+    report(rows)
+
+
+if __name__ == "__main__":
+    main()
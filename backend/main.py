@@ -1,14 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
+from services.traffic import capture_request
+from services.profiling import get_slow_request_capture, profile_request
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start background workers
+    slow_capture = get_slow_request_capture()
+    if slow_capture and slow_capture.sampler:
+        slow_capture.sampler.start()
+    tickets.triage_worker.start()
+    ai.draft_precomputer.start()
+    yield
+    await ai.draft_precomputer.stop()
+    await tickets.triage_worker.stop()
+    if slow_capture and slow_capture.sampler:
+        slow_capture.sampler.stop()
+
+
 app = FastAPI(
     title="AI Smart Helpdesk API",
     description="Backend API for the AI-powered helpdesk system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration for Next.js frontend
@@ -20,6 +42,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Diagnostics middleware is only installed when enabled, keeping it off the hot path
+if os.getenv("TRAFFIC_RECORD_PATH") or os.getenv("TRAFFIC_REPLAY_PATH"):
+    app.add_middleware(BaseHTTPMiddleware, dispatch=capture_request)
+
+if os.getenv("SLOW_REQUEST_THRESHOLD_MS"):
+    app.add_middleware(BaseHTTPMiddleware, dispatch=profile_request)
+
+
 @app.get("/")
 async def root():
     return {"message": "AI Smart Helpdesk API is running"}
@@ -29,8 +59,9 @@ async def health_check():
     return {"status": "healthy"}
 
 # Import routers after app creation to avoid circular imports
-from routers import tickets, messages, ai
+from routers import tickets, messages, ai, admin
 
 app.include_router(tickets.router, prefix="/api/tickets", tags=["tickets"])
 app.include_router(messages.router, prefix="/api/messages", tags=["messages"])
 app.include_router(ai.router, prefix="/api", tags=["ai"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
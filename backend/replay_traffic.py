@@ -0,0 +1,197 @@
+"""
+Replay recorded API traffic and compare latency and throughput.
+
+Record a log by running the API with TRAFFIC_RECORD_PATH=traffic.jsonl, then
+replay it against the current build. Upstream OpenRouter, embedding and
+Supabase calls (table queries and RPCs) are served from the log, with their
+recorded latency unless TRAFFIC_REPLAY_LATENCY=false. In-process replays
+point Supabase at an unreachable host, so nothing is read from or written
+to a live database.
+
+Logs are recorded unredacted by default because replay depends on the
+request text (local triage and search mode pick their path from it). They
+contain customer data; share a masked copy made with --export-redacted.
+A log recorded with TRAFFIC_REDACT=true, or an exported copy, is not
+replay-faithful.
+
+Usage:
+    python replay_traffic.py traffic.jsonl
+    python replay_traffic.py traffic.jsonl --concurrency 8 --report after.json
+    python replay_traffic.py traffic.jsonl --baseline before.json
+    python replay_traffic.py traffic.jsonl --base-url http://localhost:8000
+        (server must be started with TRAFFIC_REPLAY_PATH=traffic.jsonl)
+    python replay_traffic.py traffic.jsonl --export-redacted shared.jsonl
+
+Exits with status 1 when any route's p95 regresses past --threshold or a
+request returns a different status than recorded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from dotenv import load_dotenv
+import httpx
+from services.traffic import REPLAY_REQUEST_HEADER, redact_log
+
+
+def load_requests(path):
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    requests = [e for e in entries if e.get("type") == "request"]
+    return sorted(requests, key=lambda r: r["ts"])
+
+
+def route_of(request):
+    """Group paths like /api/tickets/42 under /api/tickets/{id}."""
+    path = re.sub(r"/\d+(?=/|$)", "/{id}", request["path"])
+    return f"{request['method']} {path}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(durations_by_route, wall_seconds=None):
+    routes = {}
+    for route, durations in sorted(durations_by_route.items()):
+        routes[route] = {
+            "count": len(durations),
+            "p50_ms": round(percentile(durations, 50), 2),
+            "p95_ms": round(percentile(durations, 95), 2),
+            "mean_ms": round(sum(durations) / len(durations), 2)
+        }
+    total = sum(len(d) for d in durations_by_route.values())
+    summary = {"requests": total, "routes": routes}
+    if wall_seconds:
+        summary["wall_seconds"] = round(wall_seconds, 3)
+        summary["throughput_rps"] = round(total / wall_seconds, 2)
+    return summary
+
+
+async def replay(requests, base_url, concurrency):
+    if base_url:
+        transport = None
+    else:
+        # Import after TRAFFIC_REPLAY_PATH is set so upstreams come from the log
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://replay"
+
+    durations = defaultdict(list)
+    mismatches = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120.0) as client:
+        async def send(request):
+            url = request["path"] + (f"?{request['query']}" if request.get("query") else "")
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.request(
+                    request["method"],
+                    url,
+                    json=request.get("body"),
+                    headers={REPLAY_REQUEST_HEADER: request["id"]}
+                )
+                elapsed = (time.perf_counter() - started) * 1000
+            durations[route_of(request)].append(elapsed)
+            if response.status_code != request["status"]:
+                mismatches.append((request["id"], route_of(request), request["status"], response.status_code))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(r) for r in requests))
+        wall = time.perf_counter() - started
+
+    return summarize(durations, wall), mismatches
+
+
+def compare(label, before, after, threshold):
+    print(f"\nLatency vs {label}:")
+    print(f"{'route':<40} {'n':>5} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10} {'p95 delta':>10}")
+    regressions = []
+    for route, stats in after["routes"].items():
+        base = before["routes"].get(route)
+        if not base:
+            continue
+        delta = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        flag = " !" if delta * 100 > threshold else ""
+        if flag:
+            regressions.append(route)
+        print(f"{route:<40} {stats['count']:>5} {base['p50_ms']:>11.1f} {stats['p50_ms']:>10.1f} "
+              f"{base['p95_ms']:>11.1f} {stats['p95_ms']:>10.1f} {delta:>10.1%}{flag}")
+    if before.get("throughput_rps") and after.get("throughput_rps"):
+        print(f"Throughput: {before['throughput_rps']} -> {after['throughput_rps']} req/s")
+    return regressions
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Replay recorded API traffic")
+    parser.add_argument("log", help="Traffic log recorded with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--base-url", help="Replay against a running server instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--report", help="Write the replay summary to this JSON file")
+    parser.add_argument("--baseline", help="Replay summary JSON from a previous build to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 regression threshold in percent")
+    parser.add_argument("--export-redacted", help="Write a redacted copy of the log to this file and exit")
+    args = parser.parse_args()
+
+    if args.export_redacted:
+        count = redact_log(args.log, args.export_redacted)
+        print(f"Wrote {count} redacted entries to {args.export_redacted}")
+        return
+
+    os.environ.pop("TRAFFIC_RECORD_PATH", None)
+    os.environ["TRAFFIC_REPLAY_PATH"] = args.log
+    if not args.base_url:
+        # Every Supabase call is served from the log; never reach a real project
+        os.environ["SUPABASE_URL"] = "http://replay.invalid"
+        os.environ["SUPABASE_SERVICE_KEY"] = "replay"
+        os.environ["SUPABASE_ANON_KEY"] = "replay"
+
+    requests = load_requests(args.log)
+    if not requests:
+        print("No requests in log.")
+        return
+
+    recorded = defaultdict(list)
+    for request in requests:
+        recorded[route_of(request)].append(request["duration_ms"])
+    recorded_summary = summarize(recorded)
+
+    result, mismatches = asyncio.run(replay(requests, args.base_url, args.concurrency))
+    print(f"Replayed {result['requests']} requests in {result['wall_seconds']}s "
+          f"({result['throughput_rps']} req/s, concurrency {args.concurrency})")
+
+    regressions = compare("recording", recorded_summary, result, args.threshold)
+    if args.baseline:
+        with open(args.baseline) as f:
+            for route in compare(args.baseline, json.load(f), result, args.threshold):
+                if route not in regressions:
+                    regressions.append(route)
+
+    if mismatches:
+        print(f"\n{len(mismatches)} requests returned a different status than recorded:")
+        for request_id, route, expected, actual in mismatches[:20]:
+            print(f"  {request_id} {route}: {expected} -> {actual}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if regressions:
+        print(f"\np95 regressions over {args.threshold}%: {', '.join(regressions)}")
+
+    if regressions or mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import asyncio
+import hmac
+import os
+from services.profiling import get_slow_request_capture, profile_for
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the ADMIN_API_TOKEN shared secret."""
+    expected = os.getenv("ADMIN_API_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin API is not configured")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def run_profiler(
+    seconds: float = Query(10, gt=0, le=60),
+    interval_ms: float = Query(5, ge=1, le=100)
+):
+    """
+    Sample all threads of this worker for `seconds` and return collapsed stacks.
+    Feed the output to flamegraph.pl or speedscope to get a flamegraph.
+    """
+    output = await asyncio.to_thread(profile_for, seconds, interval_ms / 1000)
+    if output is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(output)
+
+
+@router.get("/slow-requests")
+async def get_slow_requests(limit: int = Query(20, ge=1, le=500), include_stacks: bool = False):
+    """List recent requests slower than SLOW_REQUEST_THRESHOLD_MS, newest first."""
+    capture = get_slow_request_capture()
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Slow request capture is disabled")
+    
+    captures = capture.list()[:limit]
+    if not include_stacks:
+        captures = [{k: v for k, v in c.items() if k != "stacks"} for c in captures]
+    return {"threshold_ms": capture.threshold_ms, "requests": captures}
+
+
+@router.get("/slow-requests/{capture_id}/stacks", response_class=PlainTextResponse)
+async def get_slow_request_stacks(capture_id: str):
+    """Collapsed stacks sampled while a captured slow request was in flight."""
+    capture = get_slow_request_capture()
+    entry = next((c for c in capture.list() if c["id"] == capture_id), None) if capture else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return PlainTextResponse(entry["stacks"])
+
+
+@router.delete("/slow-requests")
+async def clear_slow_requests():
+    """Empty the slow request buffer."""
+    capture = get_slow_request_capture()
+    if capture is not None:
+        capture.clear()
+    return {"message": "Slow request buffer cleared"}
@@ -1,11 +1,29 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
+import os
+from supabase import create_client
 from services.openrouter import get_openrouter_client
-from services.rag import search_similar_messages
+from services.rag import hybrid_search
+from services.triage import triage_ticket, triage_tickets
+from services.drafts import (
+    DraftPrecomputer,
+    build_conversation_history,
+    compute_draft,
+    find_draft,
+    get_draft_store,
+)
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+# Supabase client - use service key to bypass RLS for backend operations
+supabase_url = os.getenv("SUPABASE_URL", "")
+supabase_key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY", "")
+supabase = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
+
+# Upper bound on tickets accepted by a single batch analysis request
+MAX_BATCH_TICKETS = 100
+
 
 class ChatMessage(BaseModel):
     role: str
@@ -35,6 +53,17 @@ class TicketAnalysisResponse(BaseModel):
     category: str
     tags: str
     summary: str
+    confidence: float  # Local classifier confidence
+    source: str = "llm"  # "local" when answered by the fast classifier
+    error: Optional[str] = None  # Set when the LLM escalation failed and the local result was kept
+
+
+class BatchTicketAnalysisRequest(BaseModel):
+    tickets: List[TicketAnalysisRequest] = Field(..., max_length=MAX_BATCH_TICKETS)
+
+
+class BatchTicketAnalysisResponse(BaseModel):
+    results: List[TicketAnalysisResponse]
 
 
 class GenerateResponseRequest(BaseModel):
@@ -49,6 +78,14 @@ class GenerateResponseResult(BaseModel):
     model: str
 
 
+class DraftResponse(BaseModel):
+    ticket_id: int
+    last_message_id: int  # 0 when the ticket has no messages yet
+    response: str
+    model: str
+    cached: bool
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_completion(request: ChatRequest):
     """
@@ -66,7 +103,7 @@ async def chat_completion(request: ChatRequest):
                 None
             )
             if last_user_msg:
-                similar = search_similar_messages(last_user_msg.content, match_count=3)
+                similar = await hybrid_search(last_user_msg.content, match_count=3)
                 if similar:
                     context = "\n".join([
                         f"- {msg.get('content', '')[:200]}" 
@@ -109,16 +146,19 @@ async def chat_completion(request: ChatRequest):
 async def analyze_ticket(request: TicketAnalysisRequest):
     """
     Analyze a ticket and suggest priority, category, and tags.
+    Confident local classifications are returned without an LLM call.
     """
     try:
-        client = get_openrouter_client()
-        result = await client.analyze_ticket(request.subject, request.description)
+        result = await triage_ticket(request.subject, request.description)
         
         return TicketAnalysisResponse(
             priority=result.get("priority", "medium"),
             category=result.get("category", "general"),
             tags=result.get("tags", "support"),
-            summary=result.get("summary", request.subject[:100])
+            summary=result.get("summary", request.subject[:100]),
+            confidence=result["confidence"],
+            source=result["source"],
+            error=result.get("error")
         )
         
     except ValueError as e:
@@ -127,6 +167,38 @@ async def analyze_ticket(request: TicketAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
 
+@router.post("/analyze-tickets", response_model=BatchTicketAnalysisResponse)
+async def analyze_tickets(request: BatchTicketAnalysisRequest):
+    """
+    Analyze multiple tickets at once.
+    Ambiguous tickets are packed into batched LLM calls; results keep request order.
+    Tickets whose LLM call failed keep the local result and carry an 'error'.
+    """
+    try:
+        results = await triage_tickets([
+            {"subject": ticket.subject, "description": ticket.description}
+            for ticket in request.tickets
+        ])
+        
+        return BatchTicketAnalysisResponse(results=[
+            TicketAnalysisResponse(
+                priority=result["priority"],
+                category=result["category"],
+                tags=result["tags"],
+                summary=result["summary"],
+                confidence=result["confidence"],
+                source=result["source"],
+                error=result.get("error")
+            )
+            for result in results
+        ])
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+
+
 @router.post("/generate-response", response_model=GenerateResponseResult)
 async def generate_ticket_response(request: GenerateResponseRequest):
     """
@@ -139,7 +211,7 @@ async def generate_ticket_response(request: GenerateResponseRequest):
         # Get RAG context
         context = None
         search_query = f"{request.ticket_subject} {request.ticket_description[:200]}"
-        similar = search_similar_messages(search_query, match_count=3)
+        similar = await hybrid_search(search_query, match_count=3)
         if similar:
             context = "\n".join([
                 f"- {msg.get('content', '')[:200]}" 
@@ -163,3 +235,38 @@ async def generate_ticket_response(request: GenerateResponseRequest):
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+
+
+async def generate_ticket_draft(ticket: Dict[str, Any], messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generate a reply draft for a stored ticket and its messages."""
+    result = await generate_ticket_response(GenerateResponseRequest(
+        ticket_subject=ticket.get("subject", ""),
+        ticket_description=ticket.get("description", ""),
+        conversation_history=build_conversation_history(ticket, messages)
+    ))
+    return {"response": result.response, "model": result.model}
+
+
+# Keeps drafts warm for open tickets; started from the app lifespan
+draft_precomputer = DraftPrecomputer(supabase, generate_ticket_draft)
+
+
+@router.get("/drafts/{ticket_id}", response_model=DraftResponse)
+async def get_ticket_draft(ticket_id: int):
+    """
+    Get the AI reply draft for a ticket.
+    Serves the precomputed draft when it matches the ticket's latest message,
+    otherwise generates one.
+    """
+    if supabase is None:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    
+    store = get_draft_store()
+    draft, last_message_id = await find_draft(store, supabase, ticket_id)
+    if draft is not None:
+        return DraftResponse(**draft, cached=True)
+    
+    draft = await compute_draft(store, supabase, generate_ticket_draft, ticket_id, last_message_id)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return DraftResponse(**draft, cached=False)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 import os
 from supabase import create_client
-from services.rag import get_embedding, search_similar_messages
+from services.traffic import execute_query, is_replaying
+from services.rag import get_embedding, hybrid_search
+from services.drafts import get_draft_store
 
 router = APIRouter()
 
@@ -23,13 +25,15 @@ class MessageCreate(BaseModel):
 class RAGQuery(BaseModel):
     query: str
     match_count: Optional[int] = 5
+    # auto: lexical for identifier-like queries (no embedding call), hybrid otherwise
+    mode: Literal["auto", "hybrid", "lexical", "vector"] = "auto"
 
 
 @router.get("/{ticket_id}")
 async def get_messages(ticket_id: int):
     """Get all messages for a ticket"""
     try:
-        result = supabase.table("messages").select("*, profiles(email, full_name)").eq("ticket_id", ticket_id).order("created_at").execute()
+        result = execute_query("supabase.messages", supabase.table("messages").select("*, profiles(email, full_name)").eq("ticket_id", ticket_id).order("created_at"))
         return {"messages": result.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -42,7 +46,7 @@ async def create_message(message: MessageCreate):
         # Generate embedding for RAG (optional - can be disabled for performance)
         embedding = None
         openai_key = os.getenv("OPENAI_API_KEY")
-        if openai_key:
+        if openai_key or is_replaying():
             embedding = get_embedding(message.content)
         
         insert_data = {
@@ -55,7 +59,11 @@ async def create_message(message: MessageCreate):
         if embedding:
             insert_data["embedding"] = embedding
             
-        result = supabase.table("messages").insert(insert_data).execute()
+        result = execute_query("supabase.messages", supabase.table("messages").insert(insert_data))
+        
+        # Cached drafts for this ticket are stale; other workers detect it via last_message_id
+        get_draft_store().invalidate(message.ticket_id)
+        
         return {"message": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -63,9 +71,9 @@ async def create_message(message: MessageCreate):
 
 @router.post("/search")
 async def search_messages(query: RAGQuery):
-    """Search messages using RAG (vector similarity)"""
+    """Search messages using full-text and/or vector similarity"""
     try:
-        results = search_similar_messages(query.query, query.match_count)
+        results = await hybrid_search(query.query, query.match_count, query.mode)
         return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
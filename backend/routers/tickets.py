@@ -4,7 +4,9 @@ from typing import Optional
 from datetime import datetime
 import os
 from supabase import create_client
+from services.traffic import execute_query
 from services.ai import analyze_sentiment, extract_tags
+from services.triage import TriageWorker
 
 router = APIRouter()
 
@@ -13,6 +15,9 @@ supabase_url = os.getenv("SUPABASE_URL", "")
 supabase_key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY", "")
 supabase = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
 
+# Triages new tickets in the background; started from the app lifespan
+triage_worker = TriageWorker(supabase)
+
 
 class TicketCreate(BaseModel):
     customer_id: str
@@ -30,9 +35,10 @@ class TicketUpdate(BaseModel):
 async def get_tickets(
     status: Optional[str] = None, 
     customer_id: Optional[str] = None,
+    q: Optional[str] = None,
     limit: int = 50
 ):
-    """Get all tickets, optionally filtered by status and customer_id"""
+    """Get all tickets, optionally filtered by status, customer_id and full-text query"""
     try:
         query = supabase.table("tickets").select("*, profiles(email, full_name)")
         
@@ -42,7 +48,13 @@ async def get_tickets(
         if customer_id:
             query = query.eq("customer_id", customer_id)
             
-        result = query.order("created_at", desc=True).limit(limit).execute()
+        query = query.order("created_at", desc=True).limit(limit)
+        
+        # text_search returns a terminal builder, so it has to be applied last
+        if q:
+            query = query.text_search("fts", q, options={"type": "web_search", "config": "english"})
+            
+        result = execute_query("supabase.tickets", query)
         return {"tickets": result.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -52,7 +64,7 @@ async def get_tickets(
 async def get_ticket(ticket_id: int):
     """Get a single ticket by ID"""
     try:
-        result = supabase.table("tickets").select("*, profiles(email, full_name)").eq("id", ticket_id).single().execute()
+        result = execute_query("supabase.tickets", supabase.table("tickets").select("*, profiles(email, full_name)").eq("id", ticket_id).single())
         return {"ticket": result.data}
     except Exception as e:
         raise HTTPException(status_code=404, detail="Ticket not found")
@@ -66,7 +78,7 @@ async def create_ticket(ticket: TicketCreate):
         sentiment_score = analyze_sentiment(ticket.description)
         tags = extract_tags(ticket.subject + " " + ticket.description)
         
-        result = supabase.table("tickets").insert({
+        result = execute_query("supabase.tickets", supabase.table("tickets").insert({
             "customer_id": ticket.customer_id,
             "subject": ticket.subject,
             "description": ticket.description,
@@ -74,7 +86,9 @@ async def create_ticket(ticket: TicketCreate):
             "sentiment_score": sentiment_score,
             "tags": tags,
             "status": "open"
-        }).execute()
+        }))
+        
+        triage_worker.submit(result.data[0])
         
         return {"ticket": result.data[0], "message": "Ticket created successfully"}
     except Exception as e:
@@ -86,7 +100,7 @@ async def update_ticket(ticket_id: int, ticket: TicketUpdate):
     """Update ticket status or priority"""
     try:
         update_data = {k: v for k, v in ticket.model_dump().items() if v is not None}
-        result = supabase.table("tickets").update(update_data).eq("id", ticket_id).execute()
+        result = execute_query("supabase.tickets", supabase.table("tickets").update(update_data).eq("id", ticket_id))
         return {"ticket": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,21 @@
 from textblob import TextBlob
 import re
+from typing import Any, Dict
+
+
+# Common helpdesk categories
+CATEGORY_KEYWORDS = {
+    "billing": ["billing", "payment", "invoice", "charge", "refund", "subscription", "price"],
+    "technical": ["error", "bug", "crash", "not working", "broken", "issue", "problem", "failed"],
+    "account": ["account", "login", "password", "access", "authentication", "sign in", "register"],
+    "shipping": ["shipping", "delivery", "order", "tracking", "shipment", "arrive"],
+    "general": ["question", "help", "support", "inquiry", "information"]
+}
+
+# Words that signal urgency regardless of tone
+URGENT_KEYWORDS = ["urgent", "asap", "immediately", "emergency", "outage", "down", "data loss", "security"]
+
+PRIORITY_LEVELS = ["low", "medium", "high", "critical"]
 
 
 def analyze_sentiment(text: str) -> float:
@@ -19,19 +35,10 @@ def extract_tags(text: str) -> str:
     Extract keywords/tags from text using simple keyword matching.
     Returns comma-separated tags.
     """
-    # Common helpdesk categories
-    categories = {
-        "billing": ["billing", "payment", "invoice", "charge", "refund", "subscription", "price"],
-        "technical": ["error", "bug", "crash", "not working", "broken", "issue", "problem", "failed"],
-        "account": ["account", "login", "password", "access", "authentication", "sign in", "register"],
-        "shipping": ["shipping", "delivery", "order", "tracking", "shipment", "arrive"],
-        "general": ["question", "help", "support", "inquiry", "information"]
-    }
-    
     text_lower = text.lower()
     found_tags = []
     
-    for category, keywords in categories.items():
+    for category, keywords in CATEGORY_KEYWORDS.items():
         for keyword in keywords:
             if keyword in text_lower:
                 if category not in found_tags:
@@ -54,3 +61,66 @@ def get_priority_from_sentiment(sentiment_score: float) -> str:
         return "medium"
     else:
         return "low"
+
+
+def _count_keyword_hits(text_lower: str, keywords) -> int:
+    """Count keywords that occur in text as whole words/phrases."""
+    return sum(
+        1 for keyword in keywords
+        if re.search(r"\b" + re.escape(keyword) + r"\b", text_lower)
+    )
+
+
+def classify_ticket(subject: str, description: str) -> Dict[str, Any]:
+    """
+    Classify a ticket locally using sentiment and keyword matching.
+    
+    Returns a dict with 'priority', 'category', 'tags', 'summary' (same shape
+    as the LLM analysis) plus 'confidence' in [0.0, 1.0]. Callers should only
+    trust the result when confidence is high and escalate otherwise.
+    """
+    text = f"{subject} {description}"
+    text_lower = text.lower()
+    
+    # Category: the keyword group with the most hits, confidence from the margin
+    hits = {
+        category: _count_keyword_hits(text_lower, keywords)
+        for category, keywords in CATEGORY_KEYWORDS.items()
+    }
+    ranked = sorted(
+        ((count, category) for category, count in hits.items() if category != "general"),
+        reverse=True
+    )
+    top_count, top_category = ranked[0]
+    runner_up = ranked[1][0]
+    
+    if top_count == 0:
+        category = "general"
+        category_confidence = 0.8 if hits["general"] else 0.3
+    else:
+        category = top_category
+        margin = (top_count - runner_up) / top_count
+        category_confidence = min(1.0, 0.4 + 0.2 * top_count) * (0.5 + 0.5 * margin)
+    
+    # Priority: sentiment bucket, bumped up by explicit urgency keywords
+    sentiment_score = analyze_sentiment(description)
+    priority = get_priority_from_sentiment(sentiment_score)
+    urgent_hits = _count_keyword_hits(text_lower, URGENT_KEYWORDS)
+    if urgent_hits:
+        bumped = PRIORITY_LEVELS.index(priority) + min(urgent_hits, 2)
+        priority = PRIORITY_LEVELS[max(min(bumped, len(PRIORITY_LEVELS) - 1), 2)]
+    
+    # Scores close to a bucket boundary are ambiguous
+    boundaries = [-0.5, -0.2, 0.2]
+    distance = min(abs(sentiment_score - b) for b in boundaries)
+    priority_confidence = min(0.9, 0.5 + distance * 2)
+    if urgent_hits:
+        priority_confidence = max(priority_confidence, 0.6 + 0.15 * min(urgent_hits, 2))
+    
+    return {
+        "priority": priority,
+        "category": category,
+        "tags": extract_tags(text),
+        "summary": subject[:100] if subject else "Support request",
+        "confidence": round(min(category_confidence, priority_confidence), 2)
+    }
@@ -0,0 +1,279 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from services.traffic import execute_query
+
+
+class DraftStore:
+    """
+    In-process cache of AI reply drafts in front of the ai_drafts table.
+    
+    Drafts are keyed by ticket and the id of the last public message they
+    were generated from (0 when the ticket has no messages yet), so a draft
+    is never served once the conversation has moved on, whichever worker
+    received the new message.
+    """
+    
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._drafts: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+        # Drafts being generated right now, so concurrent misses share one LLM call
+        self.in_flight: Dict[Tuple[int, int], asyncio.Task] = {}
+    
+    def get(self, ticket_id: int, last_message_id: int) -> Optional[Dict[str, Any]]:
+        key = (ticket_id, last_message_id)
+        draft = self._drafts.get(key)
+        if draft is not None:
+            self._drafts.move_to_end(key)
+        return draft
+    
+    def put(self, draft: Dict[str, Any]):
+        key = (draft["ticket_id"], draft["last_message_id"])
+        self._drafts[key] = draft
+        self._drafts.move_to_end(key)
+        while len(self._drafts) > self.max_entries:
+            self._drafts.popitem(last=False)
+    
+    def invalidate(self, ticket_id: int):
+        """Drop the ticket's cached drafts, e.g. when a new message is added."""
+        for key in [key for key in self._drafts if key[0] == ticket_id]:
+            del self._drafts[key]
+
+
+# Global store instance
+_draft_store: Optional[DraftStore] = None
+
+
+def get_draft_store() -> DraftStore:
+    """Get or create the global draft store instance."""
+    global _draft_store
+    if _draft_store is None:
+        _draft_store = DraftStore()
+    return _draft_store
+
+
+def get_last_message_id(supabase, ticket_id: int) -> int:
+    """Id of the ticket's latest public message, or 0 if there is none."""
+    query = supabase.table("messages").select("id").eq("ticket_id", ticket_id).not_.is_(
+        "is_internal", "true"
+    ).order("id", desc=True).limit(1)
+    result = execute_query("supabase.messages", query)
+    return result.data[0]["id"] if result.data else 0
+
+
+def load_persisted_draft(supabase, ticket_id: int, last_message_id: int) -> Optional[Dict[str, Any]]:
+    """Read a draft another worker (or an earlier pass) stored in ai_drafts."""
+    query = supabase.table("ai_drafts").select("ticket_id, last_message_id, response, model").eq(
+        "ticket_id", ticket_id
+    ).eq("last_message_id", last_message_id).limit(1)
+    result = execute_query("supabase.ai_drafts", query)
+    return result.data[0] if result.data else None
+
+
+def persist_draft(supabase, draft: Dict[str, Any]):
+    execute_query("supabase.ai_drafts", supabase.table("ai_drafts").upsert(draft))
+
+
+def load_ticket_context(supabase, ticket_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fetch a ticket and its public messages for draft generation.
+    
+    Returns:
+        Dict with 'ticket' and 'messages' (oldest first), or None if the
+        ticket does not exist
+    """
+    tickets = execute_query("supabase.tickets", supabase.table("tickets").select("*").eq("id", ticket_id).limit(1))
+    if not tickets.data:
+        return None
+    query = supabase.table("messages").select("id, sender_id, content, is_internal").eq(
+        "ticket_id", ticket_id
+    ).order("id")
+    messages = execute_query("supabase.messages", query)
+    return {
+        "ticket": tickets.data[0],
+        "messages": [m for m in messages.data or [] if not m.get("is_internal")]
+    }
+
+
+def build_conversation_history(ticket: Dict[str, Any], messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Map ticket messages to chat roles: the customer is 'user', staff are 'assistant'."""
+    return [
+        {
+            "role": "user" if m.get("sender_id") == ticket.get("customer_id") else "assistant",
+            "content": m.get("content", "")
+        }
+        for m in messages
+    ]
+
+
+DraftGenerator = Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[Dict[str, Any]]]
+
+
+async def find_draft(store: DraftStore, supabase, ticket_id: int) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    Return the stored draft matching the ticket's current last message, if
+    any, together with that last message id.
+    """
+    last_message_id = await asyncio.to_thread(get_last_message_id, supabase, ticket_id)
+    draft = store.get(ticket_id, last_message_id)
+    if draft is None:
+        draft = await asyncio.to_thread(load_persisted_draft, supabase, ticket_id, last_message_id)
+        if draft is not None:
+            store.put(draft)
+    return draft, last_message_id
+
+
+async def compute_draft(
+    store: DraftStore,
+    supabase,
+    generate: DraftGenerator,
+    ticket_id: int,
+    last_message_id: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Generate a draft for a ticket as of `last_message_id`, cache it and
+    persist it to ai_drafts. Joins the generation already in flight for the
+    same ticket and message, if any, and regenerates once if the result
+    predates `last_message_id`.
+    
+    Returns:
+        The draft dict, or None if the ticket does not exist
+    """
+    draft = None
+    for _ in range(2):
+        key = (ticket_id, last_message_id)
+        task = store.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(_generate_draft(store, supabase, generate, ticket_id))
+            store.in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: store.in_flight.pop(key, None))
+        # Shielded so one caller disconnecting does not cancel the shared generation
+        draft = await asyncio.shield(task)
+        if draft is None or draft["last_message_id"] >= last_message_id:
+            break
+    return draft
+
+
+async def _generate_draft(
+    store: DraftStore,
+    supabase,
+    generate: DraftGenerator,
+    ticket_id: int
+) -> Optional[Dict[str, Any]]:
+    context = await asyncio.to_thread(load_ticket_context, supabase, ticket_id)
+    if context is None:
+        return None
+    
+    messages = context["messages"]
+    result = await generate(context["ticket"], messages)
+    draft = {
+        "ticket_id": ticket_id,
+        "last_message_id": messages[-1]["id"] if messages else 0,
+        "response": result["response"],
+        "model": result["model"]
+    }
+    store.put(draft)
+    try:
+        await asyncio.to_thread(persist_draft, supabase, draft)
+    except Exception as e:
+        print(f"Draft persist error for ticket {ticket_id}: {e}")
+    return draft
+
+
+class DraftPrecomputer:
+    """
+    Background job that keeps drafts warm for the open-ticket queue.
+    
+    Every `interval` seconds it asks the tickets_needing_drafts RPC for open
+    tickets awaiting a staff reply (no messages yet, or the customer wrote
+    the last one) without a current draft, most urgent first, and drafts at
+    most `budget` of them with at most `max_concurrency` in flight. Only
+    the worker holding the draft_precompute lease runs a pass, so the
+    budget applies across all workers.
+    """
+    
+    def __init__(
+        self,
+        supabase,
+        generate: DraftGenerator,
+        store: Optional[DraftStore] = None,
+        interval: Optional[float] = None,
+        budget: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        self.supabase = supabase
+        self.generate = generate
+        self.store = store or get_draft_store()
+        self.interval = interval or float(os.getenv("DRAFT_PRECOMPUTE_INTERVAL", "60"))
+        self.budget = budget or int(os.getenv("DRAFT_PRECOMPUTE_BUDGET", "20"))
+        self.max_concurrency = max_concurrency or int(os.getenv("DRAFT_PRECOMPUTE_CONCURRENCY", "2"))
+        self.holder_id = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.supabase is not None
+            and bool(os.getenv("OPENROUTER_API_KEY"))
+            and os.getenv("DRAFT_PRECOMPUTE_ENABLED", "true").lower() != "false"
+        )
+    
+    def start(self):
+        """Start the precompute loop on the running event loop."""
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def _claim_lease(self) -> bool:
+        # Lease outlives one pass so the holder keeps it between passes
+        result = execute_query("supabase.claim_draft_precompute", self.supabase.rpc("claim_draft_precompute", {
+            "holder_id": self.holder_id,
+            "lease_seconds": int(self.interval * 2) + 30
+        }))
+        return bool(result.data)
+    
+    def _tickets_needing_drafts(self) -> List[Tuple[int, int]]:
+        result = execute_query(
+            "supabase.tickets_needing_drafts",
+            self.supabase.rpc("tickets_needing_drafts", {"max_count": self.budget})
+        )
+        return [(row["ticket_id"], row["last_message_id"]) for row in result.data or []]
+    
+    async def run_once(self) -> int:
+        """Run a single precompute pass; returns the number of drafts generated."""
+        if not await asyncio.to_thread(self._claim_lease):
+            return 0
+        todo = await asyncio.to_thread(self._tickets_needing_drafts)
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        
+        async def draft(ticket_id: int, last_message_id: int) -> bool:
+            async with semaphore:
+                try:
+                    draft = await compute_draft(
+                        self.store, self.supabase, self.generate, ticket_id, last_message_id
+                    )
+                    return draft is not None
+                except Exception as e:
+                    print(f"Draft precompute error for ticket {ticket_id}: {e}")
+                    return False
+        
+        results = await asyncio.gather(*(draft(tid, last_id) for tid, last_id in todo))
+        return sum(results)
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Draft precompute error: {e}")
+            await asyncio.sleep(self.interval)
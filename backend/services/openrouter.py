@@ -1,12 +1,48 @@
 import os
+import json
+import re
 import httpx
 from typing import List, Dict, Any, Optional
+from services import traffic
 
 
 # OpenRouter API configuration
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 DEFAULT_MODEL = "meta-llama/llama-3.3-70b-instruct:free"  # Free model
 
+TICKET_ANALYSIS_FIELDS = """1. Priority: critical, high, medium, or low
+2. Category: billing, technical, account, shipping, or general
+3. Tags: comma-separated list of relevant tags (max 5)
+4. Summary: one-line summary of the issue (max 100 chars)"""
+
+
+def parse_json_content(content: str) -> Any:
+    """
+    Parse JSON from a model response.
+    Tolerates markdown code fences and prose around the JSON payload.
+    
+    Raises:
+        json.JSONDecodeError: If no JSON value can be recovered
+    """
+    text = content.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    
+    # Fall back to the outermost array or object in the text
+    for opener, closer in (("[", "]"), ("{", "}")):
+        start, end = text.find(opener), text.rfind(closer)
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                continue
+    raise json.JSONDecodeError("No JSON found in model response", content, 0)
+
 
 class OpenRouterClient:
     """
@@ -44,7 +80,7 @@ class OpenRouterClient:
         Returns:
             Response dict with 'content', 'reasoning_details' (if enabled), and 'model'
         """
-        if not self.api_key:
+        if not self.api_key and not traffic.is_replaying():
             raise ValueError("OPENROUTER_API_KEY not configured")
         
         payload = {
@@ -55,14 +91,17 @@ class OpenRouterClient:
         if enable_reasoning:
             payload["reasoning"] = {"enabled": True}
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                OPENROUTER_API_URL,
-                headers=self._get_headers(),
-                json=payload
-            )
-            response.raise_for_status()
-            data = response.json()
+        async def post() -> Dict[str, Any]:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await client.post(
+                    OPENROUTER_API_URL,
+                    headers=self._get_headers(),
+                    json=payload
+                )
+                response.raise_for_status()
+                return response.json()
+        
+        data = await traffic.call_upstream_async("openrouter", payload, post)
         
         choice = data.get("choices", [{}])[0]
         message = choice.get("message", {})
@@ -137,19 +176,17 @@ Guidelines:
         Analyze a ticket and suggest priority, category, and tags.
         
         Returns:
-            Dict with 'priority', 'category', 'tags', and 'summary'
+            Dict with 'priority', 'category', 'tags', and 'summary'.
+            Includes 'fallback': True when the model response could not be parsed.
         """
         messages = [
             {
                 "role": "system",
-                "content": """You are a ticket analysis assistant. Analyze the support ticket and provide:
-1. Priority: critical, high, medium, or low
-2. Category: billing, technical, account, shipping, or general
-3. Tags: comma-separated list of relevant tags (max 5)
-4. Summary: one-line summary of the issue (max 100 chars)
+                "content": f"""You are a ticket analysis assistant. Analyze the support ticket and provide:
+{TICKET_ANALYSIS_FIELDS}
 
 Respond in JSON format only:
-{"priority": "...", "category": "...", "tags": "...", "summary": "..."}"""
+{{"priority": "...", "category": "...", "tags": "...", "summary": "..."}}"""
             },
             {
                 "role": "user",
@@ -160,18 +197,81 @@ Respond in JSON format only:
         result = await self.chat_completion(messages, enable_reasoning=False)
         
         try:
-            import json
-            analysis = json.loads(result["content"])
+            analysis = parse_json_content(result["content"])
+            if not isinstance(analysis, dict):
+                raise ValueError("Expected a JSON object")
             return analysis
-        except (json.JSONDecodeError, KeyError):
-            # Fallback to basic analysis
+        except (json.JSONDecodeError, KeyError, ValueError):
+            # Fallback to basic analysis; flagged so callers can prefer their own
             return {
                 "priority": "medium",
                 "category": "general",
                 "tags": "support",
-                "summary": subject[:100] if subject else "Support request"
+                "summary": subject[:100] if subject else "Support request",
+                "fallback": True
             }
 
+    async def analyze_tickets(self, tickets: List[Dict[str, str]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Analyze several tickets in a single completion request.
+        
+        Args:
+            tickets: List of dicts with 'subject' and 'description'
+            
+        Returns:
+            Dict mapping the ticket's index in `tickets` to its analysis.
+            Tickets the model skipped or answered malformed are omitted,
+            so callers can retry them individually.
+        """
+        if not tickets:
+            return {}
+        
+        payload = [
+            {
+                "id": i,
+                "subject": ticket.get("subject", ""),
+                "description": ticket.get("description", "")[:1000]
+            }
+            for i, ticket in enumerate(tickets)
+        ]
+        messages = [
+            {
+                "role": "system",
+                "content": f"""You are a ticket analysis assistant. You will receive a JSON array of support tickets.
+For each ticket provide:
+{TICKET_ANALYSIS_FIELDS}
+
+Respond with a JSON array only, one object per ticket, echoing each ticket's id:
+[{{"id": 0, "priority": "...", "category": "...", "tags": "...", "summary": "..."}}]"""
+            },
+            {
+                "role": "user",
+                "content": json.dumps(payload)
+            }
+        ]
+        
+        result = await self.chat_completion(messages, enable_reasoning=False)
+        
+        try:
+            parsed = parse_json_content(result["content"])
+        except (json.JSONDecodeError, KeyError):
+            return {}
+        if isinstance(parsed, dict):
+            # Some models wrap the array, e.g. {"tickets": [...]}
+            parsed = next((v for v in parsed.values() if isinstance(v, list)), [])
+        
+        analyses = {}
+        for item in parsed if isinstance(parsed, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(tickets) and item.get("priority") and item.get("category"):
+                analyses[index] = item
+        return analyses
+
 
 # Global client instance
 _openrouter_client: Optional[OpenRouterClient] = None
@@ -0,0 +1,304 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import itertools
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+# Deepest stack kept per sample
+MAX_STACK_DEPTH = 64
+
+# Collapsed stacks cached by their code objects; cleared when it grows past this
+MAX_CACHED_STACKS = 4096
+
+# Innermost frames of threads parked waiting for work (thread-pool workers,
+# queue consumers); their samples are dropped
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_current_stages: ContextVar[Optional[Dict[str, Any]]] = ContextVar("profiling_stages", default=None)
+
+_labels: Dict[Any, str] = {}
+_stacks: Dict[tuple, str] = {}
+
+
+def _thread_names() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def _is_idle(code) -> bool:
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def _collapse(frame) -> str:
+    """Render a frame's stack root-first as 'func (file:line);...'."""
+    codes = []
+    while frame is not None and len(codes) < MAX_STACK_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    key = tuple(codes)
+    stack = _stacks.get(key)
+    if stack is None:
+        if len(_stacks) >= MAX_CACHED_STACKS:
+            _stacks.clear()
+            _labels.clear()
+        stack = ";".join(_label(code) for code in reversed(codes))
+        _stacks[key] = stack
+    return stack
+
+
+def _sample(exclude: int) -> List[tuple]:
+    """One (thread name, collapsed stack) pair for every busy thread except `exclude`."""
+    names = _thread_names()
+    return [
+        (names.get(ident, str(ident)), _collapse(frame))
+        for ident, frame in sys._current_frames().items()
+        if ident != exclude and not _is_idle(frame.f_code)
+    ]
+
+
+def to_collapsed(counts: Counter) -> str:
+    """Format stack counts as collapsed-stack text (flamegraph.pl / speedscope)."""
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_for(seconds: float, interval: float = 0.005) -> Optional[str]:
+    """
+    Sample every thread's stack for `seconds` and return collapsed stacks,
+    each prefixed with its thread name. Blocks the calling thread, so run it
+    off the event loop. Returns None if another profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_name, stack in _sample(me):
+                counts[f"{thread_name};{stack}"] += 1
+            time.sleep(interval)
+        return to_collapsed(counts)
+    finally:
+        _profile_lock.release()
+
+
+class RequestSampler:
+    """
+    Low-rate background sampler feeding slow-request captures.
+
+    Samples only while at least one request is in flight (between `begin`
+    and `end`), skipping idle threads. Keeps the (time, thread, stack)
+    samples back to the start of the oldest in-flight request, capped at
+    `max_age` seconds. When a request turns out slow, the samples taken
+    while it was in flight are attached to its capture. Samples from
+    concurrent requests land in the same window, so per-request stacks
+    are approximate under load.
+    """
+
+    def __init__(self, interval: float, max_age: float = 300.0):
+        self.interval = interval
+        self.max_age = max_age
+        self._samples: deque = deque()
+        self._requests: Dict[int, float] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._active.set()  # Wake the thread if it is waiting for requests
+            self._thread.join()
+            self._thread = None
+            self._active.clear()
+
+    def begin(self, started: float) -> int:
+        """Mark a request in flight from `started`; returns a token for `end`."""
+        token = next(self._tokens)
+        with self._lock:
+            self._requests[token] = started
+            self._active.set()
+        return token
+
+    def end(self, token: int):
+        with self._lock:
+            self._requests.pop(token, None)
+            if not self._requests:
+                self._active.clear()
+                self._samples.clear()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._active.wait()
+            if self._stop.wait(self.interval):
+                return
+            if not self._active.is_set():
+                continue
+            now = time.perf_counter()
+            sample = _sample(me)
+            with self._lock:
+                oldest = min(self._requests.values(), default=now)
+                cutoff = max(oldest, now - self.max_age)
+                while self._samples and self._samples[0][0] < cutoff:
+                    self._samples.popleft()
+                for thread_name, stack in sample:
+                    self._samples.append((now, thread_name, stack))
+
+    def stacks_between(self, start: float, end: float) -> str:
+        with self._lock:
+            samples = list(self._samples)
+        counts: Counter = Counter(
+            f"{thread_name};{stack}"
+            for ts, thread_name, stack in samples
+            if start <= ts <= end
+        )
+        return to_collapsed(counts)
+
+
+class SlowRequestCapture:
+    """Keeps the most recent slow requests in a bounded ring buffer."""
+
+    def __init__(self, threshold_ms: float, buffer_size: int, sampler: Optional[RequestSampler]):
+        self.threshold_ms = threshold_ms
+        self.sampler = sampler
+        self._captures: deque = deque(maxlen=buffer_size)
+
+    def add(self, capture: Dict[str, Any]):
+        self._captures.append(capture)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return list(reversed(self._captures))
+
+    def clear(self):
+        self._captures.clear()
+
+
+_slow_capture: Optional[SlowRequestCapture] = None
+_configured = False
+
+
+def get_slow_request_capture() -> Optional[SlowRequestCapture]:
+    """
+    The slow-request capture, if SLOW_REQUEST_THRESHOLD_MS is set.
+    PROFILE_SAMPLE_INTERVAL_MS (default 20) sets the sampling rate and
+    SLOW_REQUEST_BUFFER_SIZE (default 50) how many captures are kept.
+    """
+    global _slow_capture, _configured
+    if not _configured:
+        _configured = True
+        threshold = os.getenv("SLOW_REQUEST_THRESHOLD_MS")
+        if threshold:
+            interval_ms = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "20"))
+            sampler = RequestSampler(interval_ms / 1000) if interval_ms > 0 else None
+            _slow_capture = SlowRequestCapture(
+                float(threshold),
+                int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "50")),
+                sampler
+            )
+    return _slow_capture
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@contextmanager
+def stage(name: str, awaited: bool = False):
+    """
+    Time a block as a named stage of the current request.
+
+    Blocking stages run on the event loop thread (sync calls made directly
+    from async code) are reported as '<name> (loop blocked)'; stages in
+    thread-pool offloads, or `awaited` ones, keep their plain name. A no-op
+    outside captured requests.
+    """
+    stages = _current_stages.get()
+    if stages is None:
+        yield
+        return
+
+    key = f"{name} (loop blocked)" if not awaited and _on_event_loop() else name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        with stages["lock"]:
+            entry = stages["totals"].setdefault(key, {"calls": 0, "ms": 0.0})
+            entry["calls"] += 1
+            entry["ms"] += elapsed
+
+
+async def profile_request(request, call_next):
+    """
+    HTTP middleware body: time each request and capture stage breakdowns
+    and stacks for those slower than the configured threshold.
+    """
+    capture = get_slow_request_capture()
+    if capture is None or request.url.path.startswith("/api/admin/"):
+        return await call_next(request)
+
+    stages = {"lock": threading.Lock(), "totals": {}}
+    token = _current_stages.set(stages)
+    started = time.perf_counter()
+    sampler = capture.sampler
+    sample_token = sampler.begin(started) if sampler else None
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        ended = time.perf_counter()
+        _current_stages.reset(token)
+        duration_ms = (ended - started) * 1000
+        if duration_ms >= capture.threshold_ms:
+            capture.add({
+                "id": uuid.uuid4().hex[:12],
+                "ts": time.time(),
+                "method": request.method,
+                "path": request.url.path,
+                "status": status,
+                "duration_ms": round(duration_ms, 2),
+                "stages": {
+                    name: {"calls": s["calls"], "ms": round(s["ms"], 2)}
+                    for name, s in sorted(stages["totals"].items(), key=lambda kv: -kv[1]["ms"])
+                },
+                "stacks": sampler.stacks_between(started, ended) if sampler else ""
+            })
+        if sampler:
+            sampler.end(sample_token)
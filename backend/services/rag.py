@@ -1,7 +1,18 @@
 import os
+import re
+import asyncio
 from openai import OpenAI
 from supabase import create_client
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from services import traffic
+
+# Constant from the reciprocal-rank fusion paper; damps the weight of top ranks
+RRF_K = 60
+
+SEARCH_MODES = ("auto", "hybrid", "lexical", "vector")
+
+# Tokens like ORD-12345, E1001, ERR_TIMEOUT or #4521
+_IDENTIFIER_TOKEN = re.compile(r"^#?(?=.*\d)[\w.-]+$|^[A-Z0-9]+(?:[_-][A-Z0-9]+)+$|^#\w+$")
 
 # Initialize clients
 openai_client = None
@@ -32,7 +43,7 @@ def get_embedding(text: str) -> Optional[List[float]]:
     Generate embedding for text using OpenAI's text-embedding-3-small model.
     Returns a 1536-dimensional vector.
     """
-    try:
+    def create():
         client = get_openai_client()
         if not client:
             return None
@@ -42,6 +53,9 @@ def get_embedding(text: str) -> Optional[List[float]]:
             model="text-embedding-3-small"
         )
         return response.data[0].embedding
+    
+    try:
+        return traffic.call_upstream("openai.embeddings", {"input": text}, create)
     except Exception as e:
         print(f"Embedding error: {e}")
         return None
@@ -56,18 +70,106 @@ def search_similar_messages(query: str, match_count: int = 5, match_threshold: f
         query_embedding = get_embedding(query)
         if not query_embedding:
             return []
+        
+        def match():
+            supabase = get_supabase_client()
+            if not supabase:
+                return []
+                
+            result = supabase.rpc("match_messages", {
+                "query_embedding": query_embedding,
+                "match_threshold": match_threshold,
+                "match_count": match_count
+            }).execute()
             
+            return result.data if result.data else []
+        
+        return traffic.call_upstream("supabase.match_messages", {
+            "query": query,
+            "match_threshold": match_threshold,
+            "match_count": match_count
+        }, match)
+    except Exception as e:
+        print(f"Search error: {e}")
+        return []
+
+
+def search_messages_lexical(query: str, match_count: int = 5):
+    """
+    Full-text search over message content.
+    Uses Supabase's search_messages_text RPC function (GIN-indexed tsvector).
+    """
+    def search():
         supabase = get_supabase_client()
         if not supabase:
             return []
             
-        result = supabase.rpc("match_messages", {
-            "query_embedding": query_embedding,
-            "match_threshold": match_threshold,
+        result = supabase.rpc("search_messages_text", {
+            "query_text": query,
             "match_count": match_count
         }).execute()
         
         return result.data if result.data else []
+    
+    try:
+        return traffic.call_upstream("supabase.search_messages_text", {"query": query, "match_count": match_count}, search)
     except Exception as e:
-        print(f"Search error: {e}")
+        print(f"Lexical search error: {e}")
         return []
+
+
+def is_identifier_query(query: str) -> bool:
+    """
+    Detect short queries made only of identifiers (order IDs, error codes, SKUs).
+    Lexical search answers these better than embeddings do; queries that mix
+    in ordinary words ("refund 30 days") still get vector retrieval.
+    """
+    tokens = query.split()
+    if not tokens or len(tokens) > 3:
+        return False
+    return all(_IDENTIFIER_TOKEN.match(token) for token in tokens)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists with reciprocal-rank fusion.
+    Each result scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores: Dict[Any, float] = {}
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, 1):
+            key = item.get("id")
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            merged[key] = {**merged.get(key, {}), **item}
+    
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [{**merged[key], "score": round(scores[key], 6)} for key in ranked]
+
+
+async def hybrid_search(query: str, match_count: int = 5, mode: str = "auto"):
+    """
+    Search messages with lexical and/or vector retrieval.
+    
+    Modes:
+        lexical: full-text search only, no embedding API call
+        vector: embedding similarity only (same as search_similar_messages)
+        hybrid: both run concurrently and are fused with reciprocal-rank fusion
+        auto: lexical for identifier-like queries, hybrid otherwise
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    if mode == "auto":
+        mode = "lexical" if is_identifier_query(query) else "hybrid"
+    
+    if mode == "lexical":
+        return await asyncio.to_thread(search_messages_lexical, query, match_count)
+    if mode == "vector":
+        return await asyncio.to_thread(search_similar_messages, query, match_count)
+    
+    # Over-fetch from each retriever so fusion has candidates to reorder
+    lexical, vector = await asyncio.gather(
+        asyncio.to_thread(search_messages_lexical, query, match_count * 2),
+        asyncio.to_thread(search_similar_messages, query, match_count * 2)
+    )
+    return reciprocal_rank_fusion([lexical, vector])[:match_count]
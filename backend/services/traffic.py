@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import time
+import uuid
+import array
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Optional
+from services.profiling import stage
+
+
+# Header the replay harness uses to tie a replayed request to its recording
+REPLAY_REQUEST_HEADER = "X-Replay-Request-Id"
+
+# Free-text fields masked when redaction is on (length and character classes are kept)
+REDACT_FIELDS = {"content", "description", "subject", "summary", "response", "email", "full_name", "query"}
+
+# Float lists at least this long (embeddings) are stored as base64 float32
+_PACK_MIN_FLOATS = 16
+
+_current_request_id: ContextVar[Optional[str]] = ContextVar("traffic_request_id", default=None)
+
+
+class ReplayMissError(RuntimeError):
+    """Raised when a replayed request makes an upstream call that was not recorded."""
+
+
+def _mask(text: str) -> str:
+    # Keep case, digits-vs-letters and punctuation so query shape survives
+    text = re.sub(r"[A-Z]", "X", text)
+    text = re.sub(r"[^\W\dA-Z_]", "x", text)
+    return re.sub(r"\d", "0", text)
+
+
+def redact(value: Any) -> Any:
+    """Mask free-text fields in a JSON-like value, keeping its size and shape."""
+    if isinstance(value, dict):
+        return {
+            k: _mask(v) if k in REDACT_FIELDS and isinstance(v, str) else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def redact_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mask free text in a log entry: a request's body, or an upstream
+    response (Supabase rows, LLM output). Method, path and query string
+    are kept so the request can still be sent.
+    """
+    if entry.get("type") == "request":
+        return {**entry, "body": redact(entry.get("body"))}
+    if entry.get("type") == "upstream":
+        return {**entry, "response": redact(entry.get("response"))}
+    return entry
+
+
+def redact_log(path: str, out_path: str) -> int:
+    """Write a redacted copy of a traffic log for sharing; returns the entry count."""
+    count = 0
+    with open(path) as src, open(out_path, "w") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            entry = redact_entry(json.loads(line))
+            dst.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+            count += 1
+    return count
+
+
+def _pack(value: Any) -> Any:
+    if isinstance(value, list):
+        if len(value) >= _PACK_MIN_FLOATS and all(isinstance(v, float) for v in value):
+            return {"__f32__": base64.b64encode(array.array("f", value).tobytes()).decode()}
+        return [_pack(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _pack(v) for k, v in value.items()}
+    return value
+
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"__f32__"}:
+            return array.array("f", base64.b64decode(value["__f32__"])).tolist()
+        return {k: _unpack(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(v) for v in value]
+    return value
+
+
+def upstream_key(payload: Any) -> str:
+    """Stable short hash of an upstream request payload."""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+class TrafficRecorder:
+    """
+    Appends API requests and the upstream calls they make to a JSONL log.
+
+    Each line is either a "request" entry (method, path, body, status,
+    duration) or an "upstream" entry (service, payload hash, response,
+    duration) tagged with the id of the request that made it.
+
+    Entries are stored as received by default, which is what replay needs:
+    the local classifier and hybrid search pick their code path from the
+    request text, and replay parses upstream responses as recorded. Such a
+    log holds customer data. With `redact_content` request bodies and
+    upstream responses are masked (see `redact_entry`); a redacted log is
+    not replay-faithful, so prefer recording in full and sharing a copy
+    made with `redact_log`.
+    """
+
+    def __init__(self, path: str, redact_content: bool = False):
+        self.path = path
+        self.redact_content = redact_content
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict[str, Any]):
+        if self.redact_content:
+            entry = redact_entry(entry)
+        line = json.dumps(_pack(entry), separators=(",", ":"), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class TrafficReplayer:
+    """
+    Serves upstream calls from a recorded log.
+
+    Responses are matched to the recorded request (via REPLAY_REQUEST_HEADER)
+    and service in call order, falling back to the payload hash for calls
+    made outside a replayed request. With `emulate_latency` each response is
+    delayed by its recorded duration.
+    """
+
+    def __init__(self, path: str, emulate_latency: bool = True):
+        self.emulate_latency = emulate_latency
+        self._by_request = defaultdict(deque)
+        self._by_key = defaultdict(deque)
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("type") != "upstream":
+                    continue
+                self._by_request[(entry.get("request_id"), entry["service"])].append(entry)
+                self._by_key[(entry["service"], entry["key"])].append(entry)
+
+    def next_response(self, service: str, key: str) -> Dict[str, Any]:
+        request_id = _current_request_id.get()
+        with self._lock:
+            queue = self._by_request.get((request_id, service)) if request_id else None
+            if not queue:
+                queue = self._by_key.get((service, key))
+            if not queue:
+                raise ReplayMissError(f"No recorded {service} response for request {request_id}")
+            return queue.popleft()
+
+
+_recorder: Optional[TrafficRecorder] = None
+_replayer: Optional[TrafficReplayer] = None
+_configured = False
+
+
+def _configure():
+    global _recorder, _replayer, _configured
+    if _configured:
+        return
+    _configured = True
+    replay_path = os.getenv("TRAFFIC_REPLAY_PATH")
+    record_path = os.getenv("TRAFFIC_RECORD_PATH")
+    if replay_path:
+        _replayer = TrafficReplayer(
+            replay_path,
+            emulate_latency=os.getenv("TRAFFIC_REPLAY_LATENCY", "true").lower() != "false"
+        )
+    elif record_path:
+        _recorder = TrafficRecorder(
+            record_path,
+            redact_content=os.getenv("TRAFFIC_REDACT", "false").lower() == "true"
+        )
+
+
+def get_recorder() -> Optional[TrafficRecorder]:
+    """The active recorder, if TRAFFIC_RECORD_PATH is set."""
+    _configure()
+    return _recorder
+
+
+def get_replayer() -> Optional[TrafficReplayer]:
+    """The active replayer, if TRAFFIC_REPLAY_PATH is set."""
+    _configure()
+    return _replayer
+
+
+def is_replaying() -> bool:
+    return get_replayer() is not None
+
+
+def _record(service: str, key: str, response: Any, started: float):
+    get_recorder().write({
+        "type": "upstream",
+        "request_id": _current_request_id.get(),
+        "service": service,
+        "key": key,
+        "ts": time.time(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "response": response
+    })
+
+
+def call_upstream(service: str, payload: Any, call: Callable[[], Any]) -> Any:
+    """
+    Run a blocking upstream call through the recorder/replayer.
+    `call` must return a JSON-serializable value.
+    """
+    with stage(service):
+        replayer = get_replayer()
+        if replayer is not None:
+            entry = replayer.next_response(service, upstream_key(payload))
+            if replayer.emulate_latency:
+                time.sleep(entry["duration_ms"] / 1000)
+            return _unpack(entry["response"])
+
+        if get_recorder() is None:
+            return call()
+
+        started = time.perf_counter()
+        response = call()
+        _record(service, upstream_key(payload), response, started)
+        return response
+
+
+def _query_payload(query) -> Dict[str, Any]:
+    """Describe a Supabase query builder's request without the project URL."""
+    request = getattr(query, "request", None)
+    return {
+        "method": str(getattr(request, "http_method", "")),
+        "path": str(getattr(request, "path", "")).rsplit("/rest/v1/", 1)[-1],
+        "params": str(getattr(request, "params", "")),
+        "json": getattr(request, "json", None)
+    }
+
+
+def execute_query(service: str, query) -> SimpleNamespace:
+    """
+    Execute a Supabase query builder through `call_upstream`.
+    Returns an object with `.data`, like the builder's own execute().
+    """
+    data = call_upstream(service, _query_payload(query), lambda: query.execute().data)
+    return SimpleNamespace(data=data)
+
+
+async def call_upstream_async(service: str, payload: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Async counterpart of `call_upstream`."""
+    with stage(service, awaited=True):
+        replayer = get_replayer()
+        if replayer is not None:
+            entry = replayer.next_response(service, upstream_key(payload))
+            if replayer.emulate_latency:
+                await asyncio.sleep(entry["duration_ms"] / 1000)
+            return _unpack(entry["response"])
+
+        if get_recorder() is None:
+            return await call()
+
+        started = time.perf_counter()
+        response = await call()
+        _record(service, upstream_key(payload), response, started)
+        return response
+
+
+async def capture_request(request, call_next):
+    """
+    HTTP middleware body: tag /api requests with a traffic id and, when
+    recording, log the request with its status and latency.
+    """
+    recorder = get_recorder()
+    replaying = is_replaying()
+    if not request.url.path.startswith("/api/") or (recorder is None and not replaying):
+        return await call_next(request)
+
+    if replaying:
+        request_id = request.headers.get(REPLAY_REQUEST_HEADER)
+    else:
+        request_id = uuid.uuid4().hex[:12]
+    token = _current_request_id.set(request_id)
+
+    try:
+        body = await request.body() if recorder is not None else b""
+        started = time.perf_counter()
+        response = await call_next(request)
+
+        if recorder is not None:
+            try:
+                parsed_body = json.loads(body) if body else None
+            except ValueError:
+                parsed_body = None
+            recorder.write({
+                "type": "request",
+                "id": request_id,
+                "ts": time.time(),
+                "method": request.method,
+                "path": request.url.path,
+                "query": request.url.query,
+                "body": parsed_body,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            })
+        return response
+    finally:
+        _current_request_id.reset(token)
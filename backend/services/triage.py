@@ -0,0 +1,225 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+from services.ai import classify_ticket, CATEGORY_KEYWORDS, PRIORITY_LEVELS
+from services.openrouter import get_openrouter_client
+from services.traffic import execute_query
+
+
+# Local classifications at or above this confidence skip the LLM call
+DEFAULT_CONFIDENCE_THRESHOLD = 0.75
+
+# Tickets packed into one LLM request, and LLM requests in flight at once
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+def get_confidence_threshold() -> float:
+    """Read the local-triage confidence threshold from the environment."""
+    try:
+        return float(os.getenv("TRIAGE_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD))
+    except ValueError:
+        return DEFAULT_CONFIDENCE_THRESHOLD
+
+
+def _merge_llm_result(local: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill an LLM analysis with local values for missing or invalid fields.
+    An unparseable LLM response keeps the local result, marked with 'error'.
+    """
+    if result.get("fallback"):
+        return {**local, "source": "local", "error": "LLM response could not be parsed"}
+    
+    priority = str(result.get("priority") or "").lower()
+    category = str(result.get("category") or "").lower()
+    tags = result.get("tags")
+    if isinstance(tags, list):
+        tags = ",".join(str(tag) for tag in tags)
+    return {
+        "priority": priority if priority in PRIORITY_LEVELS else local["priority"],
+        "category": category if category in CATEGORY_KEYWORDS else local["category"],
+        "tags": tags or local["tags"],
+        "summary": result.get("summary") or local["summary"],
+        "confidence": local["confidence"],
+        "source": "llm"
+    }
+
+
+async def triage_ticket(
+    subject: str,
+    description: str,
+    threshold: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Triage a ticket with a local-first cascade.
+    
+    Runs the local classifier and answers directly when it is confident
+    enough; ambiguous tickets are escalated to the LLM.
+    
+    Returns:
+        Dict with 'priority', 'category', 'tags', 'summary', 'confidence'
+        and 'source' ("local" or "llm"), plus 'error' when the escalation
+        failed and the local result was kept
+    """
+    if threshold is None:
+        threshold = get_confidence_threshold()
+    
+    local = classify_ticket(subject, description)
+    if local["confidence"] >= threshold:
+        return {**local, "source": "local"}
+    
+    client = get_openrouter_client()
+    result = await client.analyze_ticket(subject, description)
+    return _merge_llm_result(local, result)
+
+
+async def triage_tickets(
+    tickets: List[Dict[str, str]],
+    threshold: Optional[float] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    Triage many tickets, packing the ambiguous ones into batched LLM calls.
+    
+    Confident tickets are answered locally as in `triage_ticket`. The rest
+    are split into batches of `batch_size`, with at most `max_concurrency`
+    requests in flight. Tickets a parsed batch response leaves out are
+    retried one by one. If a batch request itself fails, or a retry does,
+    those tickets keep their local result with an 'error' describing the
+    failure, so callers can tell it from a confident local answer.
+    
+    Args:
+        tickets: List of dicts with 'subject' and 'description'
+        
+    Returns:
+        One result per input ticket, in the same order
+    """
+    if threshold is None:
+        threshold = get_confidence_threshold()
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tickets)
+    pending = []
+    for i, ticket in enumerate(tickets):
+        local = classify_ticket(ticket.get("subject", ""), ticket.get("description", ""))
+        results[i] = {**local, "source": "local"}
+        if local["confidence"] < threshold:
+            pending.append(i)  # Replaced once the LLM answers
+    
+    if not pending:
+        return results
+    
+    client = get_openrouter_client()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def analyze_one(index: int):
+        ticket = tickets[index]
+        async with semaphore:
+            try:
+                analysis = await client.analyze_ticket(
+                    ticket.get("subject", ""), ticket.get("description", "")
+                )
+            except Exception as e:
+                print(f"Triage error for ticket {index}: {e}")
+                results[index] = {**results[index], "error": str(e)}
+                return
+        results[index] = _merge_llm_result(results[index], analysis)
+    
+    async def analyze_batch(indices: List[int]):
+        async with semaphore:
+            try:
+                analyses = await client.analyze_tickets([tickets[i] for i in indices])
+            except Exception as e:
+                # Upstream failure: keep the local results rather than adding load
+                print(f"Batch triage error: {e}")
+                for index in indices:
+                    results[index] = {**results[index], "error": str(e)}
+                return
+        for position, index in enumerate(indices):
+            if position in analyses:
+                results[index] = _merge_llm_result(results[index], analyses[position])
+        missing = [index for position, index in enumerate(indices) if position not in analyses]
+        await asyncio.gather(*(analyze_one(index) for index in missing))
+    
+    size = max(1, batch_size)
+    batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+    await asyncio.gather(*(analyze_batch(batch) for batch in batches))
+    return results
+
+
+class TriageWorker:
+    """
+    Background worker that triages newly created tickets.
+    
+    Tickets are queued by `create_ticket`, collected into small batches and
+    triaged with `triage_tickets`; the resulting priority, category and tags
+    are written back to the ticket row.
+    """
+    
+    def __init__(self, supabase, batch_size: int = DEFAULT_BATCH_SIZE, batch_wait: float = 0.5):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.supabase is not None and os.getenv("AUTO_TRIAGE_ENABLED", "true").lower() != "false"
+    
+    def start(self):
+        """Start the worker loop on the running event loop."""
+        if self._task is None and self.enabled:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the worker loop; queued tickets are dropped."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def submit(self, ticket: Dict[str, Any]):
+        """Queue a ticket row (needs 'id', 'subject', 'description') for triage."""
+        if self._queue is not None:
+            self._queue.put_nowait(ticket)
+    
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await triage_tickets(batch, batch_size=self.batch_size)
+                threshold = get_confidence_threshold()
+                # Low-confidence local guesses would overwrite the customer's priority
+                await asyncio.gather(*(
+                    asyncio.to_thread(self._write_back, ticket["id"], result)
+                    for ticket, result in zip(batch, results)
+                    if result["source"] == "llm" or result["confidence"] >= threshold
+                ))
+            except Exception as e:
+                print(f"Auto-triage error: {e}")
+    
+    def _write_back(self, ticket_id: int, result: Dict[str, Any]):
+        execute_query("supabase.tickets", self.supabase.table("tickets").update({
+            "priority": result["priority"],
+            "category": result["category"],
+            "tags": result["tags"]
+        }).eq("id", ticket_id))
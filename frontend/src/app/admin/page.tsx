@@ -66,17 +66,8 @@ export default function AdminPage() {
         // Auto-generate draft
         try {
             setGenerating(true);
-            // Fetch messages for context
-            const messages = await messagesApi.getByTicket(ticket.id);
-
-            const result = await aiApi.generateResponse({
-                ticket_subject: ticket.subject,
-                ticket_description: ticket.description,
-                conversation_history: messages.map(m => ({
-                    role: m.sender_id.includes("agent") ? "assistant" : "user",
-                    content: m.content
-                }))
-            });
+            // Served from the precomputed draft when available
+            const result = await aiApi.getDraft(ticket.id);
             setAiDraft(result.response);
         } catch (error) {
             console.error("Failed to generate draft:", error);
@@ -8,6 +8,7 @@ export interface Ticket {
     status: 'open' | 'resolved' | 'closed';
     priority: 'low' | 'medium' | 'high' | 'critical';
     sentiment_score: number | null;
+    category: string | null;
     tags: string | null;
     created_at: string;
     profiles?: {
@@ -29,6 +30,17 @@ export interface Message {
     };
 }
 
+export type MessageSearchMode = 'auto' | 'hybrid' | 'lexical' | 'vector';
+
+// Which score is present depends on the search path taken
+export interface MessageSearchResult {
+    id: number;
+    content: string;
+    score?: number; // hybrid: reciprocal-rank fusion score
+    rank?: number; // lexical: full-text rank
+    similarity?: number; // vector: embedding similarity
+}
+
 // Tickets API
 export const ticketsApi = {
     async getAll(status?: string, customer_id?: string): Promise<Ticket[]> {
@@ -102,11 +114,11 @@ export const messagesApi = {
         return data.message;
     },
 
-    async search(query: string): Promise<{ id: number; content: string; similarity: number }[]> {
+    async search(query: string, mode: MessageSearchMode = 'auto'): Promise<MessageSearchResult[]> {
         const res = await fetch(`${API_URL}/api/messages/search`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query }),
+            body: JSON.stringify({ query, mode }),
         });
         if (!res.ok) throw new Error('Failed to search');
         const data = await res.json();
@@ -129,4 +141,10 @@ export const aiApi = {
         if (!res.ok) throw new Error('Failed to generate AI response');
         return await res.json();
     },
+
+    async getDraft(ticketId: number): Promise<{ response: string; model: string; cached: boolean }> {
+        const res = await fetch(`${API_URL}/api/ai/drafts/${ticketId}`);
+        if (!res.ok) throw new Error('Failed to fetch AI draft');
+        return await res.json();
+    },
 };
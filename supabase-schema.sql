@@ -24,7 +24,9 @@ create table public.tickets (
   status text check (status in ('open', 'resolved', 'closed')) default 'open',
   priority text check (priority in ('low', 'medium', 'high', 'critical')) default 'medium',
   sentiment_score float,
+  category text,
   tags text,
+  fts tsvector generated always as (to_tsvector('english', subject || ' ' || description)) stored,
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
@@ -35,14 +37,35 @@ create table public.messages (
   sender_id uuid references public.profiles(id) not null,
   content text not null,
   embedding vector(1536),
+  fts tsvector generated always as (to_tsvector('english', content)) stored,
   is_internal boolean default false,
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
+-- 4b. AI Drafts (precomputed replies, keyed by the last message they answer)
+create table public.ai_drafts (
+  ticket_id bigint references public.tickets(id) on delete cascade not null,
+  last_message_id bigint not null default 0,
+  response text not null,
+  model text,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  primary key (ticket_id, last_message_id)
+);
+
+-- Single-row lease so only one API worker runs the draft precompute job
+create table public.draft_precompute_lease (
+  id int primary key default 1 check (id = 1),
+  holder text not null,
+  expires_at timestamp with time zone not null
+);
+
 -- 5. RLS Policies (Security)
 alter table public.profiles enable row level security;
 alter table public.tickets enable row level security;
 alter table public.messages enable row level security;
+-- Backend-only tables: no policies, accessed with the service key
+alter table public.ai_drafts enable row level security;
+alter table public.draft_precompute_lease enable row level security;
 
 -- Profiles policies
 create policy "Public profiles are viewable by everyone" 
@@ -104,10 +127,92 @@ begin
 end;
 $$;
 
+-- 6b. Full-Text Search Function (lexical side of hybrid search)
+create or replace function search_messages_text (
+  query_text text,
+  match_count int
+)
+returns table (
+  id bigint,
+  content text,
+  rank float
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    messages.id,
+    messages.content,
+    ts_rank(messages.fts, websearch_to_tsquery('english', query_text))::float as rank
+  from messages
+  where messages.fts @@ websearch_to_tsquery('english', query_text)
+  order by rank desc
+  limit match_count;
+end;
+$$;
+
+-- 6c. Draft Precompute Functions
+create or replace function claim_draft_precompute (
+  holder_id text,
+  lease_seconds int
+)
+returns boolean
+language plpgsql
+as $$
+declare
+  claimed boolean;
+begin
+  insert into draft_precompute_lease (id, holder, expires_at)
+  values (1, holder_id, now() + make_interval(secs => lease_seconds))
+  on conflict (id) do update
+    set holder = excluded.holder, expires_at = excluded.expires_at
+    where draft_precompute_lease.holder = excluded.holder
+       or draft_precompute_lease.expires_at < now()
+  returning true into claimed;
+  return coalesce(claimed, false);
+end;
+$$;
+
+-- Open tickets awaiting a staff reply whose current conversation has no draft, most urgent first
+create or replace function tickets_needing_drafts (
+  max_count int
+)
+returns table (
+  ticket_id bigint,
+  last_message_id bigint
+)
+language sql
+stable
+as $$
+  select t.id, coalesce(m.id, 0)
+  from tickets t
+  left join lateral (
+    select messages.id, messages.sender_id
+    from messages
+    where messages.ticket_id = t.id and not coalesce(messages.is_internal, false)
+    order by messages.id desc
+    limit 1
+  ) m on true
+  where t.status = 'open'
+    -- Skip tickets waiting on the customer (staff wrote the last message)
+    and (m.id is null or m.sender_id = t.customer_id)
+    and not exists (
+      select 1 from ai_drafts d
+      where d.ticket_id = t.id and d.last_message_id = coalesce(m.id, 0)
+    )
+  order by
+    case t.priority when 'critical' then 0 when 'high' then 1 when 'medium' then 2 else 3 end,
+    t.created_at
+  limit max_count;
+$$;
+
 -- 7. Create indexes for better performance
 create index if not exists tickets_customer_id_idx on public.tickets(customer_id);
 create index if not exists tickets_status_idx on public.tickets(status);
 create index if not exists messages_ticket_id_idx on public.messages(ticket_id);
+create index if not exists messages_fts_idx on public.messages using gin(fts);
+create index if not exists tickets_fts_idx on public.tickets using gin(fts);
 
 -- 8. Function to handle new user signup (creates profile automatically)
 create or replace function public.handle_new_user()